@@ -8,20 +8,31 @@ import os
 # Add current directory to Python path
 sys.path.insert(0, os.path.dirname(__file__))
 
+from fastapi.testclient import TestClient
+import main
 
-def pytest_configure(config):
-    """Pytest configuration hook"""
-    print("\n" + "="*60)
-    print("🧪 CR310 Datalogger API - Test Suite")
-    print("="*60)
 
+def pytest_report_header(config):
+    """Pytest report header hook"""
+    return "🧪 CR310 Datalogger API - Test Suite"
 
-def pytest_sessionfinish(session, exitstatus):
-    """Pytest session finish hook"""
-    print("\n" + "="*60)
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    """Pytest terminal summary hook"""
     if exitstatus == 0:
-        print("✅ All tests passed!")
+        terminalreporter.write_line("✅ All tests passed!")
     else:
-        print(f"❌ Some tests failed (exit status: {exitstatus})")
-    print("="*60 + "\n")
+        terminalreporter.write_line(f"❌ Some tests failed (exit status: {exitstatus})")
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Test client shared by all tests, app startup/shutdown run once"""
+    with TestClient(main.app) as test_client:
+        yield test_client
+
 
+@pytest.fixture(scope="session")
+def db_client(client):
+    """MongoDB client connected by the app on startup (None without MongoDB)"""
+    return main.db_client
@@ -1,10 +1,14 @@
 """
 MongoDB database connection and operations
 """
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, DuplicateKeyError
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError
+from pymongo.write_concern import WriteConcern
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import Dict, Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from typing import Dict, List, Optional, Tuple
+import base64
+import json
 import os
 from dotenv import load_dotenv
 import logging
@@ -12,45 +16,145 @@ import logging
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# MongoDB error codes for unique index violations (the set pymongo's
+# DuplicateKeyError covers, 11001 and 12582 come from older servers)
+DUPLICATE_KEY_ERRORS = frozenset([11000, 11001, 12582])
+
+
+def encode_cursor(reading: Dict) -> str:
+    """
+    Build an opaque pagination cursor from the last reading of a page
+    The cursor is the base64-encoded (timestamp, _id) pair of that reading
+    """
+    payload = json.dumps({"timestamp": reading["timestamp"], "_id": str(reading["_id"])})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, ObjectId]:
+    """
+    Decode a pagination cursor produced by encode_cursor
+    Returns (timestamp, ObjectId), raises ValueError if the cursor is malformed
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp = payload["timestamp"]
+        if not isinstance(timestamp, str):
+            raise TypeError("timestamp must be a string")
+        return timestamp, ObjectId(payload["_id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise ValueError("Invalid pagination cursor")
+
 
 class MongoDBClient:
-    """Simple MongoDB client for CR310 readings"""
+    """Async MongoDB client for CR310 readings"""
+    
+    # Unique index that prevents duplicates, also serves equipo-filtered queries
+    EQUIPO_TIMESTAMP_INDEX = [("equipo", 1), ("timestamp", 1)]
+    # Serves unfiltered queries sorted by most recent first
+    TIMESTAMP_INDEX = [("timestamp", -1), ("_id", -1)]
+    
+    # Indexes created by ensure_indexes: (name, keys, options)
+    INDEXES = [
+        ("equipo_ts_uniq", EQUIPO_TIMESTAMP_INDEX, {"unique": True}),
+        ("ts_id_desc", TIMESTAMP_INDEX, {}),
+    ]
+    
+    # Datetime copy of the timestamp stored by earlier versions, not returned
+    READINGS_PROJECTION = {"timestamp_dt": 0}
     
     def __init__(self):
         self.client = None
         self.db = None
         self.collection = None
-        self._connect()
+        # Key patterns of the collection's indexes, mapped to whether they are unique
+        self.index_keys = {}
     
-    def _connect(self):
-        """Connect to MongoDB"""
+    async def connect(self):
+        """
+        Connect to MongoDB
+        Must be awaited from the event loop that serves requests (app startup),
+        since the Motor client binds to the loop it is first used on
+        """
         try:
             mongodb_url = os.getenv('MONGODB_URL', 'mongodb://localhost:27017')
             database_name = os.getenv('MONGODB_DATABASE', 'datalogger_db')
             collection_name = os.getenv('MONGODB_COLLECTION', 'cr310_readings')
             
-            self.client = MongoClient(mongodb_url, serverSelectionTimeoutMS=5000)
+            # Pool sized for concurrent ingestion. Writes stay acknowledged so
+            # duplicates are reported; bulk inserts can opt out per call
+            # (see insert_readings)
+            self.client = AsyncIOMotorClient(
+                mongodb_url,
+                serverSelectionTimeoutMS=5000,
+                maxPoolSize=int(os.getenv('MONGODB_MAX_POOL_SIZE', 200)),
+                minPoolSize=int(os.getenv('MONGODB_MIN_POOL_SIZE', 50)),
+                retryWrites=True,
+                compressors=os.getenv('MONGODB_COMPRESSORS', 'zstd,zlib')
+            )
             # Test connection
-            self.client.server_info()
+            await self.client.server_info()
             self.db = self.client[database_name]
             self.collection = self.db[collection_name]
             
-            # Create index on equipo and timestamp to prevent duplicates
-            self.collection.create_index([("equipo", 1), ("timestamp", 1)], unique=True)
+            # Workers started by a deployment that manages indexes separately
+            # can skip this with MONGODB_ENSURE_INDEXES=false, the indexes in
+            # INDEXES must then be created beforehand
+            if os.getenv('MONGODB_ENSURE_INDEXES', 'true').lower() == 'true':
+                await self.ensure_indexes()
+            else:
+                existing = await self.refresh_indexes()
+                missing = [name for name, keys, _ in self.INDEXES if tuple(keys) not in existing]
+                if missing:
+                    logger.warning(f"Missing indexes on {collection_name}: {', '.join(missing)} "
+                                   f"(not created, MONGODB_ENSURE_INDEXES is false)")
             
             logger.info(f"Connected to MongoDB: {database_name}/{collection_name}")
         except ConnectionFailure as e:
             logger.error(f"Failed to connect to MongoDB: {e}")
             raise
     
-    def insert_reading(self, reading: Dict) -> bool:
+    async def refresh_indexes(self) -> Dict[tuple, bool]:
+        """
+        Read the indexes of the collection into index_keys
+        Queries only hint indexes found here, since hinting a missing index fails
+        Returns index_keys, {key pattern: unique}
+        """
+        existing = await self.collection.index_information()
+        self.index_keys = {tuple(map(tuple, info["key"])): bool(info.get("unique"))
+                           for info in existing.values()}
+        return self.index_keys
+    
+    async def ensure_indexes(self):
+        """
+        Create the indexes in INDEXES that do not exist yet
+        Existing indexes are matched by their keys, so indexes created by
+        earlier versions under default names are not built again
+        Raises RuntimeError if an index exists with the same keys but a
+        different unique option (a non-unique (equipo, timestamp) index
+        would let duplicates through)
+        """
+        existing = await self.refresh_indexes()
+        
+        for name, keys, options in self.INDEXES:
+            key = tuple(keys)
+            unique = options.get("unique", False)
+            if key not in existing:
+                await self.collection.create_index(keys, name=name, **options)
+                existing[key] = unique
+                logger.info(f"Created index {name} on {self.collection.name}")
+            elif existing[key] != unique:
+                logger.error(f"Index on {keys} of {self.collection.name} must have unique={unique}, "
+                             f"drop it so {name} can be created")
+                raise RuntimeError(f"Conflicting index on {keys}, expected {name}")
+    
+    async def insert_reading(self, reading: Dict) -> bool:
         """
         Insert a reading into MongoDB
         Returns True if successful, False if duplicate or error
         """
         try:
-            result = self.collection.insert_one(reading)
-            logger.info(f"Reading inserted with ID: {result.inserted_id}")
+            result = await self.collection.insert_one(reading)
+            logger.debug("Reading inserted with ID: %s", result.inserted_id)
             return True
         except DuplicateKeyError:
             logger.warning(f"Duplicate reading detected: {reading.get('equipo')} - {reading.get('timestamp')}")
@@ -59,21 +163,48 @@ class MongoDBClient:
             logger.error(f"Error inserting reading: {e}")
             raise
     
-    def is_duplicate(self, equipo: str, timestamp: str) -> bool:
-        """Check if a reading with same equipo and timestamp exists"""
-        count = self.collection.count_documents({
-            "equipo": equipo,
-            "timestamp": timestamp
-        })
-        return count > 0
+    async def insert_readings(self, readings: List[Dict], acknowledged: bool = True) -> Tuple[int, List[int]]:
+        """
+        Insert a batch of readings with a single unordered insert_many
+        Returns (inserted_count, duplicate_indexes)
+        With acknowledged=False the write is fire-and-forget (w=0), so
+        duplicates are silently dropped by the server and not reported
+        """
+        collection = self.collection
+        if not acknowledged:
+            collection = collection.with_options(write_concern=WriteConcern(w=0))
+        
+        try:
+            result = await collection.insert_many(readings, ordered=False)
+            logger.debug("Inserted %d readings", len(result.inserted_ids))
+            return len(result.inserted_ids), []
+        except BulkWriteError as e:
+            write_errors = e.details.get('writeErrors', [])
+            duplicates = [error['index'] for error in write_errors
+                          if error.get('code') in DUPLICATE_KEY_ERRORS]
+            if len(duplicates) != len(write_errors):
+                logger.error(f"Error inserting readings: {e}")
+                raise
+            logger.warning(f"Skipped {len(duplicates)} duplicate readings in batch")
+            return e.details.get('nInserted', 0), duplicates
+        except Exception as e:
+            logger.error(f"Error inserting readings: {e}")
+            raise
     
-    def get_readings(self, equipo: Optional[str] = None, 
+    async def get_readings(self, equipo: Optional[str] = None, 
                      start_date: Optional[str] = None, 
                      end_date: Optional[str] = None,
                      limit: int = 100, 
-                     offset: int = 0) -> tuple:
+                     offset: int = 0,
+                     after: Optional[Tuple[str, ObjectId]] = None,
+                     with_total: bool = False) -> tuple:
         """
         Get readings with optional filters and pagination
+        `after` is a decoded cursor (timestamp, _id): only readings that sort
+        after it are returned, so pages are fetched with an index seek instead
+        of skipping `offset` documents (offset is kept for older clients)
+        Counting matches is expensive on large collections, so total_count is
+        only computed when `with_total` is set (None otherwise)
         Returns (readings_list, total_count)
         """
         try:
@@ -91,20 +222,49 @@ class MongoDBClient:
                 query["timestamp"] = query.get("timestamp", {})
                 query["timestamp"]["$lte"] = end_date
             
-            # Get total count
-            total_count = self.collection.count_documents(query)
+            # Get total count (unfiltered totals come from collection metadata)
+            total_count = None
+            if with_total:
+                if query:
+                    total_count = await self.collection.count_documents(query)
+                else:
+                    total_count = await self.collection.estimated_document_count()
             
-            # Get paginated results, sorted by timestamp descending
-            readings = list(self.collection.find(query)
-                          .sort("timestamp", -1)
-                          .skip(offset)
-                          .limit(limit))
+            # Resume after the last reading of the previous page
+            if after:
+                after_ts, after_id = after
+                query["timestamp"] = query.get("timestamp", {})
+                if equipo:
+                    # (equipo, timestamp) is unique, so the timestamp alone is the key
+                    query["timestamp"]["$lt"] = after_ts
+                else:
+                    # $lte bounds the index scan, $or breaks timestamp ties by _id
+                    query["timestamp"]["$lte"] = min(query["timestamp"].get("$lte", after_ts), after_ts)
+                    query["$or"] = [
+                        {"timestamp": {"$lt": after_ts}},
+                        {"timestamp": after_ts, "_id": {"$lt": after_id}}
+                    ]
             
-            # Convert ObjectId to string for JSON serialization
-            for reading in readings:
-                reading["_id"] = str(reading["_id"])
+            # Get paginated results, sorted by timestamp descending. The sort
+            # matches the hinted index so no in-memory sort is needed (the
+            # hint is skipped if the index was not found at startup)
+            if equipo:
+                index, sort = self.EQUIPO_TIMESTAMP_INDEX, [("timestamp", -1)]
+            else:
+                index, sort = self.TIMESTAMP_INDEX, self.TIMESTAMP_INDEX
+            cursor = self.collection.find(query, projection=self.READINGS_PROJECTION)
+            if tuple(index) in self.index_keys:
+                cursor = cursor.hint(index)
+            cursor = cursor.sort(sort)
+            if offset and not after:
+                # Deprecated offset pagination
+                cursor = cursor.skip(offset)
+            # Documents are returned as fetched, _id included as ObjectId,
+            # so the page is not walked a second time (the API response
+            # serializes ObjectId as a string)
+            readings = await cursor.limit(limit).to_list(length=limit)
             
-            logger.info(f"Retrieved {len(readings)} readings (total: {total_count})")
+            logger.debug("Retrieved %d readings (total: %s)", len(readings), total_count)
             return readings, total_count
             
         except Exception as e:
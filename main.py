@@ -6,16 +6,21 @@ from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 import logging
+import orjson
+from cachetools import TTLCache
+from bson import ObjectId
 import time
 from datetime import datetime
 from typing import Dict, Optional
 import os
 from dotenv import load_dotenv
 
-from models import CR310Reading, APIResponse, ReadingsListResponse
-from database import MongoDBClient
+from models import (
+    CR310Reading, APIResponse, ReadingsListResponse,
+    BulkReadingsRequest, BulkReadingsResponse
+)
+from database import MongoDBClient, encode_cursor, decode_cursor
 from validator import ReadingValidator
-from preprocessor import DataPreprocessor
 
 load_dotenv()
 
@@ -26,6 +31,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Fire-and-forget (w=0) bulk inserts for ingestion-heavy deployments
+BULK_UNACKNOWLEDGED_WRITES = os.getenv('BULK_UNACKNOWLEDGED_WRITES', 'false').lower() == 'true'
+
+# Process-local cache of GET /api/v1/readings results keyed by query params,
+# cleared on every write handled by this process
+readings_cache = TTLCache(maxsize=256, ttl=float(os.getenv('READINGS_CACHE_TTL', 5)))
+
 # Initialize FastAPI app
 app = FastAPI(
     title="CR310 Datalogger API",
@@ -57,12 +69,35 @@ class ResponseTimeMiddleware(BaseHTTPMiddleware):
 app.add_middleware(ResponseTimeMiddleware)
 
 
-# Initialize MongoDB client
-try:
-    db_client = MongoDBClient()
-except Exception as e:
-    logger.error(f"Failed to initialize MongoDB: {e}")
-    db_client = None
+def _orjson_default(value):
+    """Serialize types orjson does not handle natively (MongoDB ObjectIds)"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (native datetime support, C encoder)"""
+    
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_orjson_default)
+
+
+# MongoDB client, connected on startup so it runs on the serving event loop
+db_client: Optional[MongoDBClient] = None
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Connect to MongoDB on startup"""
+    global db_client
+    try:
+        client = MongoDBClient()
+        await client.connect()
+        db_client = client
+    except Exception as e:
+        logger.error(f"Failed to initialize MongoDB: {e}")
+        db_client = None
 
 
 @app.on_event("shutdown")
@@ -96,7 +131,7 @@ async def health_check():
     
     try:
         # Test database connection
-        db_client.client.server_info()
+        await db_client.client.server_info()
         return APIResponse(
             success=True,
             message="Service is healthy",
@@ -137,39 +172,20 @@ async def receive_reading(data: Dict):
                 detail="Database connection unavailable"
             )
         
-        # Validate reading (US2: JSON structure, required fields, ranges)
-        is_valid, error_message = ReadingValidator.validate_reading(
-            data,
-            check_duplicate=lambda equipo, timestamp: db_client.is_duplicate(equipo, timestamp)
-        )
+        # Validate (US2: JSON structure, required fields, ranges), preprocess
+        # and check consistency (US4) without building the Pydantic model.
+        # Duplicates are rejected by the unique index when inserting
+        cleaned_data, error_message = ReadingValidator.validate_and_clean(data)
         
-        if not is_valid:
+        if cleaned_data is None:
             logger.warning(f"Validation failed: {error_message}")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=error_message
             )
         
-        # Preprocess and clean data (US4)
-        cleaned_data = DataPreprocessor.clean_reading(data)
-        
-        if cleaned_data is None:
-            logger.warning("Data cleaning failed - inconsistent or null values")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Data cleaning failed: null or inconsistent values detected"
-            )
-        
-        # Check for inconsistent values (US4)
-        if not DataPreprocessor.remove_inconsistent_values(cleaned_data):
-            logger.warning("Inconsistent values detected")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Inconsistent values detected in reading"
-            )
-        
         # Store in MongoDB (US4)
-        success = db_client.insert_reading(cleaned_data)
+        success = await db_client.insert_reading(cleaned_data)
         
         if not success:
             # Duplicate detected (insert_reading returns False for duplicates)
@@ -179,12 +195,15 @@ async def receive_reading(data: Dict):
                 detail="Duplicate reading detected"
             )
         
+        # New data invalidates cached GET results
+        readings_cache.clear()
+        
         # Check response time (US3)
         process_time = time.time() - start_time
         if process_time > 1.0:
             logger.warning(f"Response time exceeded 1 second: {process_time:.3f}s")
         
-        logger.info(f"Reading stored successfully: {cleaned_data['equipo']} - {cleaned_data['timestamp']}")
+        logger.debug("Reading stored successfully: %s - %s", cleaned_data['equipo'], cleaned_data['timestamp'])
         
         # Return success response (US3: HTTP 200)
         return APIResponse(
@@ -206,13 +225,94 @@ async def receive_reading(data: Dict):
         )
 
 
+@app.post("/api/v1/readings/bulk", response_model=BulkReadingsResponse, status_code=status.HTTP_200_OK)
+async def receive_readings_bulk(payload: BulkReadingsRequest):
+    """
+    Receive and store a batch of CR310 datalogger readings
+    
+    Each reading goes through the same validation and preprocessing as
+    POST /api/v1/readings. Valid readings are stored with a single
+    insert_many; invalid and duplicate readings are reported by their
+    index in the batch without rejecting the rest.
+    """
+    start_time = time.time()
+    
+    try:
+        # Check database connection
+        if db_client is None:
+            logger.error("Database client not initialized")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Database connection unavailable"
+            )
+        
+        documents = []
+        positions = []  # Index in the batch of each document
+        errors = []
+        
+        for index, data in enumerate(payload.readings):
+            # Validate (US2), preprocess and check consistency (US4)
+            cleaned_data, error_message = ReadingValidator.validate_and_clean(data)
+            if cleaned_data is None:
+                errors.append({"index": index, "detail": error_message})
+                continue
+            
+            documents.append(cleaned_data)
+            positions.append(index)
+        
+        # Store in MongoDB with one round-trip (US4)
+        inserted = 0
+        if documents:
+            try:
+                inserted, duplicates = await db_client.insert_readings(
+                    documents,
+                    acknowledged=not BULK_UNACKNOWLEDGED_WRITES
+                )
+            finally:
+                # Unordered inserts may store part of the batch before failing
+                readings_cache.clear()
+            for duplicate in duplicates:
+                errors.append({"index": positions[duplicate], "detail": "Duplicate reading detected"})
+        errors.sort(key=lambda error: error["index"])
+        
+        # Check response time (US3)
+        process_time = time.time() - start_time
+        if process_time > 1.0:
+            logger.warning(f"Response time exceeded 1 second: {process_time:.3f}s")
+        
+        logger.debug("Bulk request stored %d of %d readings", inserted, len(payload.readings))
+        
+        return BulkReadingsResponse(
+            success=not errors,
+            message=f"Stored {inserted} of {len(payload.readings)} readings",
+            code=200,
+            received=len(payload.readings),
+            inserted=inserted,
+            errors=errors,
+            timestamp=datetime.utcnow()
+        )
+        
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
+    except Exception as e:
+        # Unexpected errors (US3: HTTP 500)
+        logger.error(f"Unexpected error processing bulk readings: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error while processing readings"
+        )
+
+
 @app.get("/api/v1/readings", response_model=ReadingsListResponse)
 async def get_readings(
     equipo: Optional[str] = Query(None, description="Filter by equipment ID"),
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD HH:MM:SS)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD HH:MM:SS)"),
     limit: int = Query(100, ge=1, le=1000, description="Number of records to return (max 1000)"),
-    offset: int = Query(0, ge=0, description="Number of records to skip for pagination")
+    after: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page"),
+    offset: int = Query(0, ge=0, deprecated=True, description="Number of records to skip (deprecated, use after)"),
+    with_total: bool = Query(False, description="Include the total number of matching records")
 ):
     """
     Get CR310 datalogger readings with optional filters
@@ -221,11 +321,24 @@ async def get_readings(
     - **start_date**: Get readings from this date onwards
     - **end_date**: Get readings up to this date
     - **limit**: Maximum number of records to return (default: 100, max: 1000)
-    - **offset**: Skip this many records (for pagination)
+    - **after**: Return the page following this cursor (use next_cursor from the previous response)
+    - **offset**: Skip this many records (deprecated, ignored when after is set)
+    - **with_total**: Also count all matching records (slower on large collections)
     
     Returns readings sorted by timestamp (most recent first)
     """
     try:
+        # Decode pagination cursor
+        after_key = None
+        if after:
+            try:
+                after_key = decode_cursor(after)
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=str(e)
+                )
+        
         # Check database connection
         if db_client is None:
             logger.error("Database client not initialized")
@@ -234,14 +347,24 @@ async def get_readings(
                 detail="Database connection unavailable"
             )
         
-        # Get readings with filters
-        readings, total_count = db_client.get_readings(
-            equipo=equipo,
-            start_date=start_date,
-            end_date=end_date,
-            limit=limit,
-            offset=offset
-        )
+        # Get readings with filters (dashboards poll the same queries)
+        cache_key = (equipo, start_date, end_date, limit, offset, after, with_total)
+        result = readings_cache.get(cache_key)
+        if result is None:
+            result = await db_client.get_readings(
+                equipo=equipo,
+                start_date=start_date,
+                end_date=end_date,
+                limit=limit,
+                offset=offset,
+                after=after_key,
+                with_total=with_total
+            )
+            readings_cache[cache_key] = result
+        readings, total_count = result
+        
+        # A full page means there may be more readings after the last one
+        next_cursor = encode_cursor(readings[-1]) if len(readings) == limit else None
         
         # Build response message
         filters = []
@@ -253,15 +376,19 @@ async def get_readings(
             filters.append(f"to {end_date}")
         
         filter_msg = f" with filters: {', '.join(filters)}" if filters else ""
+        total_msg = f" of {total_count}" if total_count is not None else ""
         
-        return ReadingsListResponse(
-            success=True,
-            message=f"Retrieved {len(readings)} of {total_count} readings{filter_msg}",
-            count=len(readings),
-            total=total_count,
-            data=readings,
-            timestamp=datetime.utcnow()
-        )
+        # Serialize the readings directly instead of re-validating them
+        # through ReadingsListResponse (still used for the OpenAPI schema)
+        return ORJSONResponse(content={
+            "success": True,
+            "message": f"Retrieved {len(readings)}{total_msg} readings{filter_msg}",
+            "count": len(readings),
+            "total": total_count,
+            "data": readings,
+            "next_cursor": next_cursor,
+            "timestamp": datetime.utcnow()
+        })
         
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -1,9 +1,28 @@
 """
 Pydantic models for CR310 datalogger data validation
 """
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from datetime import datetime
-from typing import Optional, List, Any
+from typing import Optional, List, Dict, Any
+
+
+# Maximum number of readings accepted in one bulk request
+MAX_BULK_READINGS = 1000
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    Parse a reading timestamp in 'YYYY-MM-DD HH:MM:SS' format
+    Raises ValueError if the value is not in that exact format
+    """
+    # fromisoformat is much faster than strptime but also accepts other
+    # ISO 8601 layouts, so pin the separators of the expected one first.
+    # These character checks reject malformed input faster than a regex
+    # would; fromisoformat then rejects non-digits and impossible dates
+    if (len(value) != 19 or value[4] != '-' or value[7] != '-' or value[10] != ' '
+            or value[13] != ':' or value[16] != ':'):
+        raise ValueError(f"Invalid timestamp format: {value}")
+    return datetime.fromisoformat(value)
 
 
 class CR310Reading(BaseModel):
@@ -23,25 +42,27 @@ class CR310Reading(BaseModel):
     Ozone_flow: float = Field(..., ge=0, description="Ozone flow")
     timestamp: str = Field(..., description="Timestamp of the reading")
 
-    @validator('timestamp')
+    @field_validator('timestamp')
+    @classmethod
     def validate_timestamp(cls, v):
         """Validate timestamp format"""
         try:
             # Parse timestamp to ensure it's valid
-            datetime.strptime(v, '%Y-%m-%d %H:%M:%S')
+            parse_timestamp(v)
             return v
         except ValueError:
             raise ValueError('timestamp must be in format: YYYY-MM-DD HH:MM:SS')
 
-    @validator('equipo')
+    @field_validator('equipo')
+    @classmethod
     def validate_equipo(cls, v):
         """Validate equipment identifier"""
         if not v or len(v.strip()) == 0:
             raise ValueError('equipo cannot be empty')
         return v.strip()
 
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "equipo": "T101",
                 "SO2_ppb": 25.43,
@@ -59,6 +80,7 @@ class CR310Reading(BaseModel):
                 "timestamp": "2025-10-27 18:30:00"
             }
         }
+    )
 
 
 class APIResponse(BaseModel):
@@ -68,10 +90,20 @@ class APIResponse(BaseModel):
     code: int = 200
     timestamp: Optional[datetime] = None
 
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+
+class BulkReadingsRequest(BaseModel):
+    """Request body for a batch of readings"""
+    readings: List[Dict[str, Any]] = Field(
+        ..., min_length=1, max_length=MAX_BULK_READINGS,
+        description=f"Readings to store (max {MAX_BULK_READINGS})"
+    )
+
+
+class BulkReadingsResponse(APIResponse):
+    """Response for a batch of readings"""
+    received: int
+    inserted: int
+    errors: List[Dict[str, Any]] = Field(default_factory=list)
 
 
 class ReadingsListResponse(BaseModel):
@@ -79,12 +111,8 @@ class ReadingsListResponse(BaseModel):
     success: bool
     message: str
     count: int
-    total: int
+    total: Optional[int] = None
     data: List[Any]
+    next_cursor: Optional[str] = None
     timestamp: Optional[datetime] = None
 
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
-
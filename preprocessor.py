@@ -1,16 +1,44 @@
 """
 Data preprocessing, cleaning and normalization for CR310 readings
 """
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional
 import logging
 from datetime import datetime
+from models import parse_timestamp
 
 logger = logging.getLogger(__name__)
 
+# Numeric fields of a CR310 reading, in storage order
+NUMERIC_FIELDS = (
+    'SO2_ppb', 'H2S_ppb', 'Reaction_Temp', 'IZS_Temp',
+    'PMT_Temp', 'SampleFlow', 'Pressure', 'UVLampIntensity',
+    'Box_Temp', 'HVPS_V', 'Conv_Temp', 'Ozone_flow'
+)
+
+# Temperatures that must stay within 30°C of each other
+TEMP_FIELDS = ('Reaction_Temp', 'IZS_Temp', 'PMT_Temp', 'Box_Temp', 'Conv_Temp')
+
 
 class DataPreprocessor:
     """Preprocesses and normalizes CR310 readings"""
     
+    @staticmethod
+    def normalize_reading(data: Dict, values: Iterable[float],
+                          created_at: Optional[datetime] = None) -> Dict:
+        """
+        Build the cleaned document of a reading from its numeric values
+        `values` are floats in NUMERIC_FIELDS order. Normalizes equipo, rounds
+        values to 2 decimals and adds metadata (created_at defaults to now)
+        """
+        cleaned = {
+            'equipo': data['equipo'].strip().upper(),
+            'timestamp': data['timestamp']
+        }
+        cleaned.update(zip(NUMERIC_FIELDS, [round(value, 2) for value in values]))
+        cleaned['created_at'] = created_at or datetime.utcnow()
+        cleaned['source'] = 'CR310'
+        return cleaned
+    
     @staticmethod
     def clean_reading(data: Dict) -> Optional[Dict]:
         """
@@ -18,48 +46,33 @@ class DataPreprocessor:
         Returns cleaned dict or None if invalid
         """
         try:
-            cleaned = {}
-            
-            # Normalize equipo
-            cleaned['equipo'] = data['equipo'].strip().upper()
-            
-            # Convert timestamp to datetime object for storage
+            # Validate timestamp, stored only in its original string format
+            # (the unique index and range queries work on the string)
             timestamp_str = data['timestamp']
             try:
-                timestamp_dt = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-                cleaned['timestamp'] = timestamp_str  # Keep original format
-                cleaned['timestamp_dt'] = timestamp_dt  # Also store as datetime
+                parse_timestamp(timestamp_str)
             except ValueError:
                 logger.error(f"Invalid timestamp format: {timestamp_str}")
                 return None
             
-            # Normalize all numeric fields
-            numeric_fields = [
-                'SO2_ppb', 'H2S_ppb', 'Reaction_Temp', 'IZS_Temp',
-                'PMT_Temp', 'SampleFlow', 'Pressure', 'UVLampIntensity',
-                'Box_Temp', 'HVPS_V', 'Conv_Temp', 'Ozone_flow'
-            ]
-            
-            for field in numeric_fields:
-                value = data.get(field)
+            # Convert all numeric fields (presence is checked by ReadingValidator)
+            values = []
+            for field in NUMERIC_FIELDS:
+                value = data[field]
                 
                 # Remove null or None values
                 if value is None:
                     logger.warning(f"Null value detected for {field}, skipping reading")
                     return None
                 
-                # Convert to float and round to 2 decimals
+                # Convert to float
                 try:
-                    cleaned[field] = round(float(value), 2)
+                    values.append(float(value))
                 except (ValueError, TypeError):
                     logger.error(f"Invalid numeric value for {field}: {value}")
                     return None
             
-            # Add metadata
-            cleaned['created_at'] = datetime.utcnow()
-            cleaned['source'] = 'CR310'
-            
-            return cleaned
+            return DataPreprocessor.normalize_reading(data, values)
             
         except Exception as e:
             logger.error(f"Error cleaning reading: {e}")
@@ -71,23 +84,24 @@ class DataPreprocessor:
         Check for inconsistent values and remove if found
         Returns True if data is consistent, False otherwise
         """
-        # Check for inconsistent temperature readings
-        temps = [
-            data.get('Reaction_Temp'),
-            data.get('IZS_Temp'),
-            data.get('PMT_Temp'),
-            data.get('Box_Temp'),
-            data.get('Conv_Temp')
-        ]
-        
-        # Remove None values
-        temps = [t for t in temps if t is not None]
+        # Check for inconsistent temperature readings, skipping None values
+        min_temp = max_temp = None
+        for field in TEMP_FIELDS:
+            temp = data.get(field)
+            if temp is None:
+                continue
+            if min_temp is None:
+                min_temp = max_temp = temp
+            elif temp < min_temp:
+                min_temp = temp
+            elif temp > max_temp:
+                max_temp = temp
         
-        if len(temps) < 2:
+        if min_temp is None:
             return True  # Not enough data to check consistency
         
         # Check if temperatures are within reasonable range of each other
-        temp_range = max(temps) - min(temps)
+        temp_range = max_temp - min_temp
         if temp_range > 30:  # More than 30°C difference
             logger.warning(f"Large temperature range detected: {temp_range}°C")
             return False
@@ -3,31 +3,45 @@ Pytest test suite for CR310 Datalogger API
 Run with: pytest test_api.py -v
 """
 import pytest
-from fastapi.testclient import TestClient
 from datetime import datetime
+from types import MappingProxyType
 import sys
 import os
+import time
+import itertools
+from functools import partial
 
 # Add current directory to path to import modules
 sys.path.insert(0, os.path.dirname(__file__))
 
-from main import app
+import main
 from database import MongoDBClient
+from validator import ReadingValidator
 
 
-# Test client
-client = TestClient(app)
+# Test data fixtures
+# Unique IDs for test equipment and timestamps, seeded once per session
+_ID_SEQ = itertools.count(int(time.time()))
 
+# Equipment ID prefix of this test process, one per pytest-xdist worker so
+# parallel workers never share (or clean up) each other's readings
+_EQUIPO_PREFIX = f"TEST_{os.environ.get('PYTEST_XDIST_WORKER', 'gw0').upper()}_"
 
-# Test data fixtures
-@pytest.fixture
-def valid_reading_t101():
-    """Valid reading for test equipment"""
-    import time
-    # Generate unique ID for each fixture usage
-    unique_id = int(time.time() * 1000000) % 1000000
-    return {
-        "equipo": f"TEST_{unique_id}",
+
+def _with(base, **overrides) -> dict:
+    """Copy of a reading with some fields replaced"""
+    return {**base, **overrides}
+
+
+def _unique_timestamp(hour: int, unique_id: int) -> str:
+    """Timestamp within the given hour derived from a unique ID"""
+    return f"2025-10-27 {hour}:{(unique_id // 10000) % 60:02d}:{unique_id % 60:02d}"
+
+
+@pytest.fixture(scope="module")
+def _base_reading():
+    """Frozen measurements of a valid reading, shared by the reading fixtures"""
+    return MappingProxyType({
         "SO2_ppb": 25.43,
         "H2S_ppb": 2.18,
         "Reaction_Temp": 35.0,
@@ -39,19 +53,29 @@ def valid_reading_t101():
         "Box_Temp": 33.7,
         "HVPS_V": 671.2,
         "Conv_Temp": 35.9,
-        "Ozone_flow": 480.5,
-        "timestamp": f"2025-10-27 18:{(unique_id // 10000) % 60:02d}:{unique_id % 60:02d}"
+        "Ozone_flow": 480.5
+    })
+
+
+@pytest.fixture
+def valid_reading_t101(_base_reading):
+    """Valid reading for test equipment"""
+    # Generate unique ID for each fixture usage
+    unique_id = next(_ID_SEQ)
+    return {
+        "equipo": f"{_EQUIPO_PREFIX}{unique_id}",
+        **_base_reading,
+        "timestamp": _unique_timestamp(18, unique_id)
     }
 
 
 @pytest.fixture
 def valid_reading_t102():
     """Valid reading for test equipment"""
-    import time
     # Generate unique ID for each fixture usage
-    unique_id = int(time.time() * 1000000) % 1000000
+    unique_id = next(_ID_SEQ)
     return {
-        "equipo": f"TEST_{unique_id + 1}",  # +1 to ensure different from t101
+        "equipo": f"{_EQUIPO_PREFIX}{unique_id}",
         "SO2_ppb": 30.5,
         "H2S_ppb": 3.2,
         "Reaction_Temp": 36.0,
@@ -64,56 +88,51 @@ def valid_reading_t102():
         "HVPS_V": 680.0,
         "Conv_Temp": 36.5,
         "Ozone_flow": 490.0,
-        "timestamp": f"2025-10-27 19:{(unique_id // 10000) % 60:02d}:{unique_id % 60:02d}"
+        "timestamp": _unique_timestamp(19, unique_id)
     }
 
 
 @pytest.fixture
 def reading_missing_fields():
     """Reading with missing required fields"""
-    import time
-    unique_id = int(time.time() * 1000000) % 1000000
+    unique_id = next(_ID_SEQ)
     return {
-        "equipo": f"TEST_{unique_id + 2}",
+        "equipo": f"{_EQUIPO_PREFIX}{unique_id}",
         "SO2_ppb": 25.43,
-        "timestamp": f"2025-10-27 18:{(unique_id // 10000) % 60:02d}:{unique_id % 60:02d}"
+        "timestamp": _unique_timestamp(18, unique_id)
     }
 
 
 @pytest.fixture
-def reading_out_of_range():
+def reading_out_of_range(_base_reading):
     """Reading with out of range values"""
-    import time
-    unique_id = int(time.time() * 1000000) % 1000000
+    unique_id = next(_ID_SEQ)
     return {
-        "equipo": f"TEST_{unique_id + 3}",
+        "equipo": f"{_EQUIPO_PREFIX}{unique_id}",
+        **_base_reading,
         "SO2_ppb": 99999,  # Out of range
-        "H2S_ppb": 2.18,
-        "Reaction_Temp": 35.0,
-        "IZS_Temp": 34.2,
-        "PMT_Temp": 36.1,
-        "SampleFlow": 452.3,
-        "Pressure": 29.76,
-        "UVLampIntensity": 403.5,
-        "Box_Temp": 33.7,
-        "HVPS_V": 671.2,
-        "Conv_Temp": 35.9,
-        "Ozone_flow": 480.5,
-        "timestamp": f"2025-10-27 18:{(unique_id // 10000) % 60:02d}:{unique_id % 60:02d}"
+        "timestamp": _unique_timestamp(18, unique_id)
     }
 
 
-@pytest.fixture(scope="module", autouse=True)
-def cleanup_test_data():
+def _delete_test_data(client, db_client):
+    """Remove the test data of this process (equipment starting with _EQUIPO_PREFIX)"""
+    if db_client is None:
+        raise RuntimeError("Database connection unavailable")
+    # Run on the app's event loop, which the Motor client is bound to
+    # Prefix match as a range, served by the (equipo, timestamp) index
+    prefix_end = _EQUIPO_PREFIX[:-1] + chr(ord(_EQUIPO_PREFIX[-1]) + 1)
+    client.portal.call(db_client.collection.delete_many, {
+        "equipo": {"$gte": _EQUIPO_PREFIX, "$lt": prefix_end}
+    })
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cleanup_test_data(client, db_client):
     """Clean up test data before and after tests"""
     # Setup: Clean test data before tests
     try:
-        db_client = MongoDBClient()
-        # Remove all test data (equipment starting with TEST)
-        db_client.collection.delete_many({
-            "equipo": {"$regex": "^TEST"}
-        })
-        db_client.close()
+        _delete_test_data(client, db_client)
         print("\n🧹 Cleaned up existing TEST data before tests")
     except Exception as e:
         print(f"\n⚠️  Warning: Could not clean up before tests: {e}")
@@ -122,12 +141,7 @@ def cleanup_test_data():
     
     # Teardown: Clean test data after tests
     try:
-        db_client = MongoDBClient()
-        # Remove all test data (equipment starting with TEST)
-        db_client.collection.delete_many({
-            "equipo": {"$regex": "^TEST"}
-        })
-        db_client.close()
+        _delete_test_data(client, db_client)
         print("\n✅ Test data cleaned up")
     except Exception as e:
         print(f"\n⚠️  Warning: Could not clean up after tests: {e}")
@@ -136,7 +150,7 @@ def cleanup_test_data():
 class TestHealthEndpoints:
     """Test health check endpoints"""
     
-    def test_root_endpoint(self):
+    def test_root_endpoint(self, client):
         """Test GET / - root endpoint"""
         response = client.get("/")
         assert response.status_code == 200
@@ -145,7 +159,7 @@ class TestHealthEndpoints:
         assert "CR310 Datalogger API is running" in data["message"]
         assert data["code"] == 200
     
-    def test_health_endpoint(self):
+    def test_health_endpoint(self, client):
         """Test GET /health - health check endpoint"""
         response = client.get("/health")
         assert response.status_code == 200
@@ -157,24 +171,36 @@ class TestHealthEndpoints:
 class TestPostReadings:
     """Test POST /api/v1/readings endpoint"""
     
-    def test_post_valid_reading_t101(self, valid_reading_t101):
-        """Test 1: POST valid reading for T101 (should succeed)"""
-        response = client.post("/api/v1/readings", json=valid_reading_t101)
-        assert response.status_code == 200
-        data = response.json()
-        assert data["success"] is True
-        assert "Reading stored successfully" in data["message"]
-        assert data["code"] == 200
-    
-    def test_post_valid_reading_t102(self, valid_reading_t102):
-        """Test 2: POST valid reading for T102 (should succeed)"""
-        response = client.post("/api/v1/readings", json=valid_reading_t102)
-        assert response.status_code == 200
+    @pytest.mark.parametrize("reading_fixture, overrides, expected_status, expected_text", [
+        # Tests 1-2: valid readings (should succeed)
+        pytest.param("valid_reading_t101", {}, 200, "Reading stored successfully", id="valid-t101"),
+        pytest.param("valid_reading_t102", {}, 200, "Reading stored successfully", id="valid-t102"),
+        # Tests 4-8, 30: invalid readings (should fail with 400)
+        pytest.param("reading_missing_fields", {}, 400, "Missing required fields", id="missing-fields"),
+        pytest.param("reading_out_of_range", {}, 400, "out of range", id="out-of-range"),
+        pytest.param("valid_reading_t101", {"timestamp": "2025/10/27 18:30:00"}, 400, "timestamp",
+                     id="invalid-timestamp-format"),
+        pytest.param("valid_reading_t101", {"equipo": ""}, 400, "equipo", id="empty-equipo"),
+        pytest.param("valid_reading_t101", {"SO2_ppb": None}, 400, "must be numeric", id="null-value"),
+        pytest.param("valid_reading_t101", {"timestamp": "2025-02-30 18:30:00"}, 400, "timestamp",
+                     id="invalid-timestamp-date"),  # February 30th
+    ])
+    def test_post_reading(self, client, request, reading_fixture, overrides,
+                          expected_status, expected_text):
+        """Tests 1-2, 4-8, 30: POST a reading and check the status code and message"""
+        reading = _with(request.getfixturevalue(reading_fixture), **overrides)
+        
+        response = client.post("/api/v1/readings", json=reading)
+        assert response.status_code == expected_status
         data = response.json()
-        assert data["success"] is True
-        assert "Reading stored successfully" in data["message"]
+        if expected_status == 200:
+            assert data["success"] is True
+            assert data["code"] == 200
+            assert expected_text in data["message"]
+        else:
+            assert expected_text in data["detail"]
     
-    def test_post_duplicate_reading(self, valid_reading_t101):
+    def test_post_duplicate_reading(self, client, valid_reading_t101):
         """Test 3: POST duplicate reading (should fail with 400)"""
         # First post should succeed
         response1 = client.post("/api/v1/readings", json=valid_reading_t101)
@@ -185,59 +211,142 @@ class TestPostReadings:
         assert response2.status_code == 400
         assert "Duplicate" in response2.json()["detail"]
     
-    def test_post_missing_fields(self, reading_missing_fields):
-        """Test 4: POST reading with missing fields (should fail with 400)"""
-        response = client.post("/api/v1/readings", json=reading_missing_fields)
-        assert response.status_code == 400
-        assert "Missing required fields" in response.json()["detail"]
+    def test_duplicate_index(self, client, db_client):
+        """Test 32: App startup creates the unique (equipo, timestamp) index that rejects duplicates"""
+        if db_client is None:
+            pytest.fail("Database connection unavailable")
+        indexes = client.portal.call(db_client.collection.index_information)
+        unique_keys = [index["key"] for index in indexes.values() if index.get("unique")]
+        assert [("equipo", 1), ("timestamp", 1)] in [list(map(tuple, key)) for key in unique_keys]
     
-    def test_post_out_of_range(self, reading_out_of_range):
-        """Test 5: POST reading with out of range values (should fail with 400)"""
-        response = client.post("/api/v1/readings", json=reading_out_of_range)
-        assert response.status_code == 400
-        assert "out of range" in response.json()["detail"].lower()
-    
-    def test_post_invalid_timestamp_format(self, valid_reading_t101):
-        """Test 6: POST reading with invalid timestamp format (should fail with 400)"""
-        import time
-        unique_id = int(time.time() * 1000000) % 1000000
-        invalid_reading = valid_reading_t101.copy()
-        invalid_reading["timestamp"] = "2025/10/27 18:30:00"  # Wrong format
-        invalid_reading["equipo"] = f"TEST_{unique_id + 4}"  # Different equipment
-        
-        response = client.post("/api/v1/readings", json=invalid_reading)
-        assert response.status_code == 400
+    def test_conflicting_index(self, client, db_client):
+        """Test 34: A non-unique (equipo, timestamp) index fails index setup"""
+        if db_client is None:
+            pytest.fail("Database connection unavailable")
+        conflicting = MongoDBClient()
+        conflicting.collection = db_client.db[f"{db_client.collection.name}_{_EQUIPO_PREFIX}INDEXES"]
+        try:
+            client.portal.call(conflicting.collection.create_index, MongoDBClient.EQUIPO_TIMESTAMP_INDEX)
+            with pytest.raises(RuntimeError, match="Conflicting index"):
+                client.portal.call(conflicting.ensure_indexes)
+        finally:
+            client.portal.call(conflicting.collection.drop)
+    
+    def test_startup_without_index_creation(self, client, db_client, monkeypatch):
+        """Test 35: With MONGODB_ENSURE_INDEXES=false startup creates no indexes and GET still works"""
+        if db_client is None:
+            pytest.fail("Database connection unavailable")
+        monkeypatch.setenv("MONGODB_ENSURE_INDEXES", "false")
+        monkeypatch.setenv("MONGODB_COLLECTION", f"{db_client.collection.name}_{_EQUIPO_PREFIX}STARTUP")
+        startup_client = MongoDBClient()
+        client.portal.call(startup_client.connect)
+        try:
+            indexes = client.portal.call(startup_client.collection.index_information)
+            assert set(indexes) <= {"_id_"}  # Empty until the collection exists
+            # Missing indexes are not hinted, so queries do not fail
+            readings, _ = client.portal.call(startup_client.get_readings)
+            assert readings == []
+        finally:
+            client.portal.call(startup_client.collection.drop)
+            startup_client.close()
+
+
+class TestBulkReadings:
+    """Test POST /api/v1/readings/bulk endpoint"""
+    
+    def test_post_bulk_valid_readings(self, client, valid_reading_t101, valid_reading_t102):
+        """Test 26: POST a batch of valid readings (should store all)"""
+        response = client.post(
+            "/api/v1/readings/bulk",
+            json={"readings": [valid_reading_t101, valid_reading_t102]}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert data["received"] == 2
+        assert data["inserted"] == 2
+        assert data["errors"] == []
     
-    def test_post_empty_equipo(self, valid_reading_t101):
-        """Test 7: POST reading with empty equipo (should fail with 400)"""
-        invalid_reading = valid_reading_t101.copy()
-        invalid_reading["equipo"] = ""
-        invalid_reading["timestamp"] = "2025-10-27 20:00:00"
+    def test_post_bulk_partial_failure(self, client, valid_reading_t101, reading_out_of_range):
+        """Test 27: POST a batch with invalid and duplicate readings (should report them)"""
+        response = client.post("/api/v1/readings", json=valid_reading_t101)
+        assert response.status_code == 200
         
-        response = client.post("/api/v1/readings", json=invalid_reading)
-        assert response.status_code == 400
+        response = client.post(
+            "/api/v1/readings/bulk",
+            json={"readings": [reading_out_of_range, valid_reading_t101]}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is False
+        assert data["inserted"] == 0
+        assert [error["index"] for error in data["errors"]] == [0, 1]
+        assert "out of range" in data["errors"][0]["detail"].lower()
+        assert "Duplicate" in data["errors"][1]["detail"]
+        
+        # Errors stay in batch order when no reading is stored
+        inconsistent_reading = _with(valid_reading_t101, equipo=f"{valid_reading_t101['equipo']}_TEMP",
+                                     Reaction_Temp=20.0, Conv_Temp=55.0)  # More than 30°C apart
+        response = client.post(
+            "/api/v1/readings/bulk",
+            json={"readings": [inconsistent_reading, reading_out_of_range]}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["inserted"] == 0
+        assert [error["index"] for error in data["errors"]] == [0, 1]
+        assert "Inconsistent" in data["errors"][0]["detail"]
     
-    def test_post_null_value(self, valid_reading_t101):
-        """Test 8: POST reading with null value (should fail with 400)"""
-        invalid_reading = valid_reading_t101.copy()
-        invalid_reading["SO2_ppb"] = None
-        invalid_reading["timestamp"] = "2025-10-27 20:01:00"
+    def test_post_bulk_stored_values(self, client, valid_reading_t101):
+        """Test 33: Bulk readings are stored with the same values as single POSTs"""
+        # Values halfway between two 2-decimal numbers, rounded by their binary value
+        reading = _with(valid_reading_t101, SampleFlow=417.335, H2S_ppb=2.675)
+        bulk_reading = _with(reading, equipo=f"{reading['equipo']}_BULK")
         
-        response = client.post("/api/v1/readings", json=invalid_reading)
-        assert response.status_code == 400
+        response = client.post("/api/v1/readings", json=reading)
+        assert response.status_code == 200
+        response = client.post("/api/v1/readings/bulk", json={"readings": [bulk_reading]})
+        assert response.status_code == 200
+        assert response.json()["inserted"] == 1
+        
+        single = client.get(f"/api/v1/readings?equipo={reading['equipo']}").json()["data"]
+        bulk = client.get(f"/api/v1/readings?equipo={bulk_reading['equipo']}").json()["data"]
+        assert len(single) == len(bulk) == 1
+        for field in ReadingValidator.VALID_RANGES:
+            assert bulk[0][field] == single[0][field], field
+    
+    def test_post_bulk_empty_batch(self, client):
+        """Test 28: POST an empty batch (should fail with 422)"""
+        response = client.post("/api/v1/readings/bulk", json={"readings": []})
+        assert response.status_code == 422
 
 
 class TestGetReadings:
     """Test GET /api/v1/readings endpoint"""
     
-    @pytest.fixture(autouse=True)
-    def setup_test_data(self, valid_reading_t101, valid_reading_t102):
-        """Ensure we have test data for GET tests"""
-        # Post readings if they don't exist
-        client.post("/api/v1/readings", json=valid_reading_t101)
-        client.post("/api/v1/readings", json=valid_reading_t102)
+    @pytest.fixture(scope="class", autouse=True)
+    @classmethod
+    def _seed_readings(cls, client, db_client, _base_reading):
+        """Insert two readings once for all GET tests, directly into MongoDB"""
+        unique_id = next(_ID_SEQ)
+        cls.equipo_t101 = f"{_EQUIPO_PREFIX}{unique_id}"
+        cls.equipo_t102 = f"{_EQUIPO_PREFIX}{next(_ID_SEQ)}"
+        if db_client is None:
+            return  # GET tests fail on their own without MongoDB
+        
+        # Stored exactly as POST /api/v1/readings would store them
+        documents = [
+            ReadingValidator.validate_and_clean({
+                "equipo": equipo,
+                **_base_reading,
+                "timestamp": _unique_timestamp(hour, unique_id)
+            })[0]
+            for equipo, hour in ((cls.equipo_t101, 18), (cls.equipo_t102, 19))
+        ]
+        client.portal.call(partial(db_client.collection.insert_many, documents, ordered=False))
+        main.readings_cache.clear()
     
-    def test_get_all_readings(self):
+    def test_get_all_readings(self, client):
         """Test 9: GET all readings (should succeed)"""
         response = client.get("/api/v1/readings")
         assert response.status_code == 200
@@ -249,25 +358,21 @@ class TestGetReadings:
         assert isinstance(data["data"], list)
         assert data["count"] >= 0
     
-    def test_get_readings_filter_by_equipo(self, valid_reading_t101):
+    def test_get_readings_filter_by_equipo(self, client):
         """Test 10: GET readings filtered by equipment (should succeed)"""
-        # First create a reading to ensure we have data
-        test_reading = valid_reading_t101
-        equipo_id = test_reading["equipo"]
-        client.post("/api/v1/readings", json=test_reading)
-        
-        # Now get readings for this equipment
+        # Get readings for the equipment seeded by _seed_readings
+        equipo_id = self.equipo_t101
         response = client.get(f"/api/v1/readings?equipo={equipo_id}")
         assert response.status_code == 200
         data = response.json()
         assert data["success"] is True
-        assert data["count"] >= 0
+        assert data["count"] == 1
         
         # All returned readings should be for this equipment
         for reading in data["data"]:
             assert reading["equipo"] == equipo_id
     
-    def test_get_readings_with_pagination(self):
+    def test_get_readings_with_pagination(self, client):
         """Test 11: GET readings with pagination (should succeed)"""
         response = client.get("/api/v1/readings?limit=1&offset=0")
         assert response.status_code == 200
@@ -276,7 +381,56 @@ class TestGetReadings:
         assert data["count"] <= 1  # Should return at most 1 reading
         assert len(data["data"]) <= 1
     
-    def test_get_readings_with_date_filter(self):
+    def test_get_readings_with_cursor(self, client):
+        """Test 23: GET next page using next_cursor (should not repeat readings)"""
+        response = client.get("/api/v1/readings?limit=1")
+        assert response.status_code == 200
+        first_page = response.json()
+        assert first_page["count"] == 1
+        assert first_page["next_cursor"] is not None
+        
+        response = client.get(f"/api/v1/readings?limit=1&after={first_page['next_cursor']}")
+        assert response.status_code == 200
+        second_page = response.json()
+        assert second_page["success"] is True
+        assert second_page["count"] == 1
+        assert second_page["data"][0]["_id"] != first_page["data"][0]["_id"]
+        assert second_page["data"][0]["timestamp"] <= first_page["data"][0]["timestamp"]
+    
+    def test_get_readings_invalid_cursor(self, client):
+        """Test 24: GET readings with malformed cursor (should fail with 400)"""
+        response = client.get("/api/v1/readings?after=not-a-cursor")
+        assert response.status_code == 400
+        assert "cursor" in response.json()["detail"]
+    
+    def test_get_readings_with_total(self, client):
+        """Test 25: GET readings with total count only when requested"""
+        response = client.get("/api/v1/readings")
+        assert response.status_code == 200
+        assert response.json()["total"] is None
+        
+        response = client.get("/api/v1/readings?with_total=true")
+        assert response.status_code == 200
+        data = response.json()
+        assert isinstance(data["total"], int)
+        assert data["total"] >= data["count"]
+    
+    def test_get_readings_after_new_post(self, client, valid_reading_t101):
+        """Test 29: GET reflects a reading posted after the same query was served"""
+        new_reading = _with(valid_reading_t101, equipo=f"{valid_reading_t101['equipo']}_NEW")  # Not seeded yet
+        url = f"/api/v1/readings?equipo={new_reading['equipo']}"
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.json()["count"] == 0
+        
+        response = client.post("/api/v1/readings", json=new_reading)
+        assert response.status_code == 200
+        
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.json()["count"] == 1
+    
+    def test_get_readings_with_date_filter(self, client):
         """Test 12: GET readings with date filter (should succeed)"""
         response = client.get(
             "/api/v1/readings?start_date=2025-10-27 00:00:00&end_date=2025-10-27 23:59:59"
@@ -285,14 +439,10 @@ class TestGetReadings:
         data = response.json()
         assert data["success"] is True
     
-    def test_get_readings_combined_filters(self, valid_reading_t101):
+    def test_get_readings_combined_filters(self, client):
         """Test 13: GET readings with combined filters (should succeed)"""
-        # First create a reading to ensure we have data
-        test_reading = valid_reading_t101
-        equipo_id = test_reading["equipo"]
-        client.post("/api/v1/readings", json=test_reading)
-        
-        # Now get readings with combined filters
+        # Get readings for the equipment seeded by _seed_readings
+        equipo_id = self.equipo_t101
         response = client.get(f"/api/v1/readings?equipo={equipo_id}&limit=10")
         assert response.status_code == 200
         data = response.json()
@@ -303,13 +453,13 @@ class TestGetReadings:
         for reading in data["data"]:
             assert reading["equipo"] == equipo_id
     
-    def test_get_readings_invalid_limit(self):
+    def test_get_readings_invalid_limit(self, client):
         """Test 14: GET readings with invalid limit (should handle gracefully)"""
         response = client.get("/api/v1/readings?limit=5000")  # Over max
         # Should either clamp to max or return 422
         assert response.status_code in [200, 422]
     
-    def test_get_readings_nonexistent_equipo(self):
+    def test_get_readings_nonexistent_equipo(self, client):
         """Test 15: GET readings for non-existent equipment (should return empty)"""
         response = client.get("/api/v1/readings?equipo=NONEXISTENT")
         assert response.status_code == 200
@@ -322,14 +472,13 @@ class TestGetReadings:
 class TestDataValidation:
     """Test data validation and preprocessing"""
     
-    def test_equipo_normalization(self):
+    def test_equipo_normalization(self, client):
         """Test 16: Equipment ID should be normalized to uppercase"""
-        import time
-        unique_id = int(time.time() * 1000000) % 1000000
-        unique_ts = f"2025-10-27 21:{(unique_id // 10000) % 60:02d}:{unique_id % 60:02d}"
+        unique_id = next(_ID_SEQ)
+        unique_ts = _unique_timestamp(21, unique_id)
         
         reading = {
-            "equipo": f"test_{unique_id}",  # lowercase - will be normalized to TEST_{unique_id}
+            "equipo": f"{_EQUIPO_PREFIX.lower()}{unique_id}",  # lowercase - will be normalized to uppercase
             "SO2_ppb": 25.43,
             "H2S_ppb": 2.18,
             "Reaction_Temp": 35.0,
@@ -349,21 +498,20 @@ class TestDataValidation:
         assert response.status_code == 200
         
         # Get the reading back and check it's uppercase
-        get_response = client.get(f"/api/v1/readings?equipo=TEST_{unique_id}")
+        get_response = client.get(f"/api/v1/readings?equipo={_EQUIPO_PREFIX}{unique_id}")
         assert get_response.status_code == 200
         data = get_response.json()
         if data["count"] > 0:
             # Equipment ID should be normalized to uppercase
-            assert data["data"][0]["equipo"] == f"TEST_{unique_id}".upper()
+            assert data["data"][0]["equipo"] == f"{_EQUIPO_PREFIX}{unique_id}".upper()
     
-    def test_numeric_precision(self):
+    def test_numeric_precision(self, client):
         """Test 17: Numeric values should be rounded to 2 decimals"""
-        import time
-        unique_id = int(time.time() * 1000000) % 1000000
-        unique_ts = f"2025-10-27 22:{(unique_id // 10000) % 60:02d}:{unique_id % 60:02d}"
+        unique_id = next(_ID_SEQ)
+        unique_ts = _unique_timestamp(22, unique_id)
         
         reading = {
-            "equipo": f"TEST_{unique_id + 5}",
+            "equipo": f"{_EQUIPO_PREFIX}{unique_id}",
             "SO2_ppb": 25.123456789,  # Many decimals
             "H2S_ppb": 2.987654321,
             "Reaction_Temp": 35.0,
@@ -383,7 +531,7 @@ class TestDataValidation:
         assert response.status_code == 200
         
         # Get the reading and verify rounding
-        get_response = client.get(f"/api/v1/readings?equipo=TEST_{unique_id + 5}")
+        get_response = client.get(f"/api/v1/readings?equipo={_EQUIPO_PREFIX}{unique_id}")
         assert get_response.status_code == 200
         data = get_response.json()
         if data["count"] > 0:
@@ -395,15 +543,12 @@ class TestDataValidation:
 class TestResponseTime:
     """Test response time requirements (< 1 second)"""
     
-    def test_post_response_time(self, valid_reading_t101):
+    def test_post_response_time(self, client, valid_reading_t101):
         """Test 18: POST response time should be < 1 second"""
-        import time
-        
         # Use unique timestamp and equipment ID
-        unique_id = int(time.time() * 1000000) % 1000000
-        reading = valid_reading_t101.copy()
-        reading["timestamp"] = f"2025-10-27 23:{(unique_id // 10000) % 60:02d}:{unique_id % 60:02d}"
-        reading["equipo"] = f"TEST_{unique_id + 6}"
+        unique_id = next(_ID_SEQ)
+        reading = _with(valid_reading_t101, equipo=f"{_EQUIPO_PREFIX}{unique_id}",
+                        timestamp=_unique_timestamp(23, unique_id))
         
         start_time = time.time()
         response = client.post("/api/v1/readings", json=reading)
@@ -412,10 +557,8 @@ class TestResponseTime:
         assert response.status_code in [200, 400]  # Could fail validation
         assert elapsed_time < 1.0, f"Response time {elapsed_time:.3f}s exceeded 1 second"
     
-    def test_get_response_time(self):
+    def test_get_response_time(self, client):
         """Test 19: GET response time should be < 1 second"""
-        import time
-        
         start_time = time.time()
         response = client.get("/api/v1/readings")
         elapsed_time = time.time() - start_time
@@ -427,7 +570,7 @@ class TestResponseTime:
 class TestErrorHandling:
     """Test error handling and edge cases"""
     
-    def test_post_invalid_json(self):
+    def test_post_invalid_json(self, client):
         """Test 20: POST with invalid JSON structure (should fail gracefully)"""
         response = client.post(
             "/api/v1/readings",
@@ -436,16 +579,23 @@ class TestErrorHandling:
         )
         assert response.status_code == 422
     
-    def test_post_wrong_data_type(self, valid_reading_t101):
+    def test_post_wrong_data_type(self, client, valid_reading_t101):
         """Test 21: POST with wrong data type (should fail with 400)"""
-        invalid_reading = valid_reading_t101.copy()
-        invalid_reading["SO2_ppb"] = "not a number"  # Should be float
-        invalid_reading["timestamp"] = "2025-10-27 23:30:00"
+        invalid_reading = _with(valid_reading_t101, SO2_ppb="not a number",  # Should be float
+                                timestamp="2025-10-27 23:30:00")
+        
+        response = client.post("/api/v1/readings", json=invalid_reading)
+        assert response.status_code == 400
+    
+    def test_post_boolean_value(self, client, valid_reading_t101):
+        """Test 31: POST with boolean instead of number (should fail with 400)"""
+        invalid_reading = _with(valid_reading_t101, SO2_ppb=True)  # bool is not numeric
         
         response = client.post("/api/v1/readings", json=invalid_reading)
         assert response.status_code == 400
+        assert "must be numeric" in response.json()["detail"]
     
-    def test_get_invalid_query_params(self):
+    def test_get_invalid_query_params(self, client):
         """Test 22: GET with invalid query parameters (should handle gracefully)"""
         response = client.get("/api/v1/readings?limit=invalid")
         assert response.status_code == 422  # FastAPI validation error
@@ -2,11 +2,16 @@
 Business logic validation for CR310 readings
 """
 from typing import Dict, Tuple, Optional
-from models import CR310Reading
+from pydantic import TypeAdapter
+from models import CR310Reading, parse_timestamp
+from preprocessor import NUMERIC_FIELDS, DataPreprocessor
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Validates raw dicts against CR310Reading directly in pydantic-core
+_VALIDATOR = TypeAdapter(CR310Reading)
+
 
 class ReadingValidator:
     """Validates CR310 readings according to business rules"""
@@ -27,104 +32,134 @@ class ReadingValidator:
         'Ozone_flow': (0, 1000)
     }
     
+    # Required fields in reporting order, and as a set for the presence check,
+    # taken from the model so they follow its schema (all fields are required)
+    _REQUIRED_FIELDS = tuple(CR310Reading.model_fields)
+    _REQUIRED = frozenset(_REQUIRED_FIELDS)
+    
+    # Fields a reading may contain
+    _EXPECTED_FIELDS = _REQUIRED
+    
+    # Flattened (field, min, max) ranges
+    _RANGE_CHECK = tuple((field, min_val, max_val)
+                         for field, (min_val, max_val) in VALID_RANGES.items())
+    
     @staticmethod
     def validate_required_fields(data: Dict) -> Tuple[bool, Optional[str]]:
         """
         Check if all required fields are present
         Returns (is_valid, error_message)
         """
-        required_fields = [
-            'equipo', 'SO2_ppb', 'H2S_ppb', 'Reaction_Temp', 'IZS_Temp',
-            'PMT_Temp', 'SampleFlow', 'Pressure', 'UVLampIntensity',
-            'Box_Temp', 'HVPS_V', 'Conv_Temp', 'Ozone_flow', 'timestamp'
-        ]
+        missing = ReadingValidator._REQUIRED.difference(data)
         
-        missing_fields = [field for field in required_fields if field not in data]
-        
-        if missing_fields:
+        if missing:
+            # Report in field order, sets have none
+            missing_fields = [field for field in ReadingValidator._REQUIRED_FIELDS if field in missing]
             return False, f"Missing required fields: {', '.join(missing_fields)}"
         
         return True, None
     
     @staticmethod
-    def validate_json_structure(data: Dict) -> Tuple[bool, Optional[str]]:
+    def validate_reading(data: Dict) -> Tuple[bool, Optional[str]]:
         """
-        Validate JSON structure matches expected format
+        Complete validation of a reading
+        Duplicates are not checked here: the unique (equipo, timestamp) index
+        rejects them on insert, see MongoDBClient.insert_reading
         Returns (is_valid, error_message)
         """
-        # Check for unexpected fields (optional - can be removed for flexibility)
-        expected_fields = set(ReadingValidator.VALID_RANGES.keys()) | {'equipo', 'timestamp'}
-        
-        unexpected_fields = set(data.keys()) - expected_fields
-        if unexpected_fields:
-            logger.warning(f"Unexpected fields in data: {unexpected_fields}")
-            # Don't fail on this, just log
-        
-        # Validate data types
-        numeric_fields = [k for k, v in ReadingValidator.VALID_RANGES.items()]
-        
-        for field in numeric_fields:
-            if field in data:
-                if not isinstance(data[field], (int, float)):
-                    return False, f"Field '{field}' must be numeric"
-        
-        if 'equipo' in data and not isinstance(data['equipo'], str):
-            return False, "Field 'equipo' must be a string"
-        
-        if 'timestamp' in data and not isinstance(data['timestamp'], str):
-            return False, "Field 'timestamp' must be a string"
+        # Check required fields, structure, model constraints and ranges
+        error = ReadingValidator._check_fields(data)
+        if error:
+            return False, error
         
         return True, None
     
     @staticmethod
-    def validate_ranges(reading: CR310Reading) -> Tuple[bool, Optional[str]]:
+    def validate_and_clean(data: Dict) -> Tuple[Optional[Dict], Optional[str]]:
         """
-        Validate that all values are within acceptable ranges
-        Returns (is_valid, error_message)
+        Validate, clean and consistency-check a reading
+        Same result as validate_reading followed by DataPreprocessor.clean_reading
+        and DataPreprocessor.remove_inconsistent_values, whose normalize and
+        consistency steps it reuses rather than repeating them in one pass
+        Returns (cleaned_reading, error_message)
         """
-        out_of_range = []
+        error = ReadingValidator._check_fields(data)
+        if error:
+            return None, error
         
-        for field, (min_val, max_val) in ReadingValidator.VALID_RANGES.items():
-            value = getattr(reading, field)
-            if value < min_val or value > max_val:
-                out_of_range.append(f"{field}={value} (valid: {min_val}-{max_val})")
+        cleaned = DataPreprocessor.normalize_reading(
+            data, [float(data[field]) for field in NUMERIC_FIELDS]
+        )
         
-        if out_of_range:
-            return False, f"Values out of range: {', '.join(out_of_range)}"
+        if not DataPreprocessor.remove_inconsistent_values(cleaned):
+            return None, "Inconsistent values detected in reading"
         
-        return True, None
+        return cleaned, None
     
     @staticmethod
-    def validate_reading(data: Dict, check_duplicate: callable = None) -> Tuple[bool, Optional[str]]:
+    def _check_fields(data: Dict) -> Optional[str]:
         """
-        Complete validation of a reading
-        Returns (is_valid, error_message)
+        Check presence, then types, model constraints and ranges in one pass over the fields
+        Errors are reported in that order: missing fields, non-numeric values,
+        equipo and timestamp types, CR310Reading model errors, out of range values.
+        The model only runs when a fast check fails, to report its own errors
+        Returns the error message, or None if the reading is valid
         """
-        # Check required fields
         is_valid, error = ReadingValidator.validate_required_fields(data)
         if not is_valid:
-            return False, error
+            return error
         
-        # Check JSON structure
-        is_valid, error = ReadingValidator.validate_json_structure(data)
-        if not is_valid:
-            return False, error
+        type_error = None
+        out_of_range = []
+        needs_model = False  # Values only the Pydantic model can judge (NaN, huge ints)
+        
+        for field, min_val, max_val in ReadingValidator._RANGE_CHECK:
+            value = data[field]
+            value_type = type(value)
+            if value_type is not float and value_type is not int:
+                type_error = type_error or f"Field '{field}' must be numeric"
+                continue
+            
+            if not min_val <= value <= max_val:
+                # Out of range, NaN, or an int too large for a float
+                try:
+                    value = float(value)
+                except OverflowError:
+                    needs_model = True
+                    continue
+                if value != value:
+                    needs_model = True
+                else:
+                    out_of_range.append(f"{field}={value} (valid: {min_val}-{max_val})")
+        
+        if logger.isEnabledFor(logging.WARNING):
+            unexpected_fields = data.keys() - ReadingValidator._EXPECTED_FIELDS
+            if unexpected_fields:
+                logger.warning("Unexpected fields in data: %s", unexpected_fields)
+        
+        if type_error:
+            return type_error
+        
+        equipo = data['equipo']
+        timestamp = data['timestamp']
+        if type(equipo) is not str:
+            return "Field 'equipo' must be a string"
+        if type(timestamp) is not str:
+            return "Field 'timestamp' must be a string"
         
-        # Validate using Pydantic model
         try:
-            reading = CR310Reading(**data)
-        except Exception as e:
-            return False, f"Validation error: {str(e)}"
-        
-        # Check value ranges
-        is_valid, error = ReadingValidator.validate_ranges(reading)
-        if not is_valid:
-            return False, error
-        
-        # Check for duplicates (if duplicate checker provided)
-        if check_duplicate:
-            if check_duplicate(data.get('equipo'), data.get('timestamp')):
-                return False, "Duplicate reading detected"
-        
-        return True, None
-
+            parse_timestamp(timestamp)
+            timestamp_valid = True
+        except ValueError:
+            timestamp_valid = False
+        
+        if not equipo.strip() or not timestamp_valid or out_of_range or needs_model:
+            # Rare path: let the Pydantic model report its own errors first
+            try:
+                _VALIDATOR.validate_python(data)
+            except Exception as e:
+                return f"Validation error: {str(e)}"
+            if out_of_range:
+                return f"Values out of range: {', '.join(out_of_range)}"
+        
+        return None